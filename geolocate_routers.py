@@ -1,26 +1,138 @@
 #!/usr/bin/env python3
 """
-Taiwan Router Geolocation using MaxMind GeoIP2
+Taiwan Router Geolocation using MaxMind GeoLite2
 Quick start script for initial IP geolocation
 """
 
-import geoip2.database
+import maxminddb
+import asyncio
+import ipaddress
 import socket
 import csv
+import mmap
+import os
 import re
+import sqlite3
+import stat
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterator, List, Tuple, Optional, Union
+
+try:
+    import aiodns
+except ImportError:  # fall back to threaded socket lookups
+    aiodns = None
+
+try:
+    import ahocorasick
+except ImportError:  # fall back to the combined regex
+    ahocorasick = None
+
+IPAddress = Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+
+# "   1. 140.123.103.250    csgate103.cs.ccu.edu.tw", matched across a whole file
+_IP_LINE_RE = re.compile(rb'(?m)^\s*\d+\.[ \t]+(\d{1,3}(?:\.\d{1,3}){3})(?=\s)([^\n]*)')
+
+# Taiwan city code mappings for DNS analysis
+TAIWAN_CODES = {
+    'tpe': 'Taipei',
+    'tpq': 'Taipei',
+    'ntc': 'New Taipei',
+    'ntpc': 'New Taipei',
+    'tyn': 'Taoyuan',
+    'ty': 'Taoyuan',
+    'tcn': 'Taichung',
+    'tc': 'Taichung',
+    'txg': 'Taichung',
+    'tnn': 'Tainan',
+    'tn': 'Tainan',
+    'khh': 'Kaohsiung',
+    'kh': 'Kaohsiung',
+    'hsc': 'Hsinchu',
+    'hc': 'Hsinchu',
+    'hch': 'Hsinchu',
+    'hl': 'Hualien',
+    'il': 'Yilan',
+    'tt': 'Taitung',
+    'nt': 'Nantou',
+    'cy': 'Chiayi',
+    'ml': 'Miaoli',
+    'cl': 'Changhua',
+    'yl': 'Yunlin',
+    'pt': 'Pingtung',
+}
+
+# One alternation over all codes, longest first so 'ntpc' wins over 'ntc'
+_CODE_RE = re.compile(
+    r'(?:\b|[-_.])('
+    + '|'.join(map(re.escape, sorted(TAIWAN_CODES, key=len, reverse=True)))
+    + r')(?:\b|[-_.]|\d|$)'
+)
+
+# Aho-Corasick scans a hostname once regardless of how many codes exist
+_CODE_AUTOMATON = None
+if ahocorasick is not None:
+    _CODE_AUTOMATON = ahocorasick.Automaton()
+    for _code in TAIWAN_CODES:
+        _CODE_AUTOMATON.add_word(_code, _code)
+    _CODE_AUTOMATON.make_automaton()
+
+@dataclass(slots=True)
+class RouterResult:
+    """Geolocation result for a single IP address"""
+    ip: str
+    country: Optional[str] = None
+    city: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    accuracy_radius: Optional[int] = None
+    postal_code: Optional[str] = None
+    subdivision: Optional[str] = None
+    isp: Optional[str] = None
+    hostname: Optional[str] = None
+    dns_hints: Optional[str] = None
+    confidence: Optional[str] = None
+    error: Optional[str] = None
+
 
 class RouterGeolocator:
-    def __init__(self, mmdb_path: str = 'GeoLite2-City.mmdb'):
+    CSV_FIELDS = ['ip', 'country', 'city', 'subdivision', 'latitude', 'longitude',
+                  'accuracy_radius', 'postal_code', 'hostname', 'dns_hints',
+                  'confidence', 'error']
+    
+    # Rows written between flushes when streaming results to CSV
+    CSV_FLUSH_EVERY = 100
+    
+    # Entries looked up per sorted MaxMind batch; bounds memory while streaming
+    GEO_WINDOW = 10_000
+    
+    # IPs fetched per PTR cache query
+    PTR_CACHE_CHUNK = 500
+    
+    def __init__(self, mmdb_path: str = 'GeoLite2-City.mmdb',
+                 dns_timeout: float = 2.0, dns_concurrency: int = 64,
+                 ptr_cache: Optional[str] = 'ptr_cache.sqlite', ttl_seconds: float = 86400):
         """
         Initialize with MaxMind database
         
         Args:
             mmdb_path: Path to the .mmdb database file
+            dns_timeout: Per-query reverse DNS timeout in seconds (needs aiodns)
+            dns_concurrency: Maximum number of reverse DNS queries in flight
+            ptr_cache: Path to the SQLite reverse DNS cache, or None to disable it
+            ttl_seconds: How long cached hostnames stay valid
         """
+        self.dns_timeout = dns_timeout
+        self.dns_concurrency = dns_concurrency
+        self.ttl_seconds = ttl_seconds
+        
         try:
-            self.reader = geoip2.database.Reader(mmdb_path)
+            self.reader = maxminddb.open_database(mmdb_path, maxminddb.MODE_AUTO)
             print(f"✓ Successfully loaded database: {mmdb_path}")
         except FileNotFoundError:
             print(f"✗ Database file not found: {mmdb_path}")
@@ -28,111 +140,207 @@ class RouterGeolocator:
             print("wget https://github.com/P3TERX/GeoLite.mmdb/raw/download/GeoLite2-City.mmdb")
             raise
         
-        # Taiwan city code mappings for DNS analysis
-        self.taiwan_codes = {
-            'tpe': 'Taipei',
-            'tpq': 'Taipei',
-            'ntc': 'New Taipei',
-            'ntpc': 'New Taipei',
-            'tyn': 'Taoyuan',
-            'ty': 'Taoyuan',
-            'tcn': 'Taichung',
-            'tc': 'Taichung',
-            'txg': 'Taichung',
-            'tnn': 'Tainan',
-            'tn': 'Tainan',
-            'khh': 'Kaohsiung',
-            'kh': 'Kaohsiung',
-            'hsc': 'Hsinchu',
-            'hc': 'Hsinchu',
-            'hch': 'Hsinchu',
-            'hl': 'Hualien',
-            'il': 'Yilan',
-            'tt': 'Taitung',
-            'nt': 'Nantou',
-            'cy': 'Chiayi',
-            'ml': 'Miaoli',
-            'cl': 'Changhua',
-            'yl': 'Yunlin',
-            'pt': 'Pingtung',
-        }
+        # Opened after the reader so a missing .mmdb leaves no cache file behind.
+        # The connection is shared across threads (lookup_ip may run in a pool),
+        # so every use goes through _ptr_cache_lock.
+        self._ptr_cache = None
+        self._ptr_cache_lock = threading.Lock()
+        if ptr_cache:
+            # Autocommit without fsync: the cache is cheap to rebuild if lost
+            self._ptr_cache = sqlite3.connect(ptr_cache, isolation_level=None,
+                                              check_same_thread=False)
+            self._ptr_cache.execute('PRAGMA synchronous=OFF')
+            self._ptr_cache.execute(
+                'CREATE TABLE IF NOT EXISTS ptr (ip TEXT PRIMARY KEY, hostname TEXT, expires REAL)'
+            )
     
-    def lookup_ip(self, ip_address: str) -> Dict:
+    def lookup_ip(self, ip_address: str, known_hostname: Optional[str] = None) -> RouterResult:
         """
-        Lookup single IP address in MaxMind database
+        Lookup single IP address in MaxMind database and reverse DNS
+        
+        Args:
+            ip_address: IP address to geolocate
+            known_hostname: Hostname already known for the IP; skips reverse DNS
         
         Returns:
-            Dictionary with location information
+            RouterResult with location information
         """
-        result = {
-            'ip': ip_address,
-            'country': None,
-            'city': None,
-            'latitude': None,
-            'longitude': None,
-            'accuracy_radius': None,
-            'postal_code': None,
-            'subdivision': None,
-            'isp': None,
-            'hostname': None,
-            'dns_hints': None,
-            'confidence': None
-        }
+        address, error = _check_ip(ip_address)
         
-        # MaxMind lookup
-        try:
-            response = self.reader.city(ip_address)
-            result['country'] = response.country.name
-            result['city'] = response.city.name
-            result['latitude'] = response.location.latitude
-            result['longitude'] = response.location.longitude
-            result['accuracy_radius'] = response.location.accuracy_radius
-            result['postal_code'] = response.postal.code
-            
-            # Get subdivision (state/province)
-            if response.subdivisions:
-                result['subdivision'] = response.subdivisions.most_specific.name
-                
-        except geoip2.errors.AddressNotFoundError:
-            result['error'] = 'IP not found in database'
-        except Exception as e:
-            result['error'] = str(e)
+        hostname = known_hostname
+        if not hostname and address is not None:
+            hostname = self._resolve_global_hostnames([ip_address])[ip_address]
         
-        # DNS reverse lookup
-        try:
-            hostname = socket.gethostbyaddr(ip_address)[0]
-            result['hostname'] = hostname
-            result['dns_hints'] = self.extract_location_from_hostname(hostname)
-        except (socket.herror, socket.gaierror):
-            pass
+        return self._annotate(self._lookup_geo(ip_address, error), hostname)
+    
+    def _annotate(self, result: RouterResult, hostname: Optional[str]) -> RouterResult:
+        """Add hostname, DNS hints and confidence to a MaxMind result"""
+        if hostname:
+            result.hostname = hostname
+            result.dns_hints = self.extract_location_from_hostname(hostname)
         
         # Calculate confidence score
-        result['confidence'] = self.calculate_confidence(result)
+        result.confidence = self.calculate_confidence(result)
         
         return result
     
-    def extract_location_from_hostname(self, hostname: str) -> Optional[str]:
+    def _lookup_geo(self, ip_address: str, error: Optional[str]) -> RouterResult:
         """
-        Extract location hints from hostname using Taiwan city codes
+        MaxMind-only lookup (no network access) for an IP already checked by _check_ip
         
-        Args:
-            hostname: Domain name or hostname
-            
         Returns:
-            Detected city name or None
+            RouterResult with location information, DNS fields left empty
         """
-        hostname_lower = hostname.lower()
+        result = RouterResult(ip_address)
         
-        # Check for Taiwan city codes
-        for code, city in self.taiwan_codes.items():
-            # Look for code as whole word or with delimiters
-            pattern = rf'\b{code}\b|[-_.]{code}[-_.]|{code}\d'
-            if re.search(pattern, hostname_lower):
-                return city
+        # Invalid and private/reserved addresses are never in the database
+        if error:
+            result.error = error
+            return result
         
-        return None
+        # MaxMind lookup: read the raw record and pick out only the fields we use
+        try:
+            record = self.reader.get(ip_address)
+        except Exception as e:
+            result.error = str(e)
+            return result
+        
+        if record is None:
+            result.error = 'IP not found in database'
+            return result
+        
+        location = record.get('location', {})
+        result.country = record.get('country', {}).get('names', {}).get('en')
+        result.city = record.get('city', {}).get('names', {}).get('en')
+        result.latitude = location.get('latitude')
+        result.longitude = location.get('longitude')
+        result.accuracy_radius = location.get('accuracy_radius')
+        result.postal_code = record.get('postal', {}).get('code')
+        
+        # Get subdivision (state/province), most specific last
+        subdivisions = record.get('subdivisions')
+        if subdivisions:
+            result.subdivision = subdivisions[-1].get('names', {}).get('en')
+        
+        return result
+    
+    def reverse_dns(self, ip_address: str) -> Optional[str]:
+        """
+        Resolve the PTR hostname of an IP address (blocking network call)
+        
+        Returns:
+            Hostname or None if the lookup failed
+        """
+        # getnameinfo only asks for the PTR name, unlike gethostbyaddr which
+        # also collects aliases and addresses
+        try:
+            hostname, _ = socket.getnameinfo((ip_address, 0), socket.NI_NAMEREQD)
+            return hostname
+        except socket.gaierror:
+            return None
     
-    def calculate_confidence(self, result: Dict) -> str:
+    def resolve_hostnames(self, ip_list: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Resolve PTR hostnames for many IPs concurrently
+        
+        Uses aiodns when installed so every query is bounded by dns_timeout;
+        otherwise, or when called from inside a running event loop, falls
+        back to reverse_dns in a thread pool, where the system resolver
+        decides the timeout.
+        
+        Returns:
+            Dictionary mapping each IP to its hostname (or None)
+        """
+        hostnames = {}
+        global_ips = []
+        for ip in ip_list:
+            if _check_ip(ip)[0] is not None:
+                global_ips.append(ip)
+            else:
+                # Private/reserved PTR queries only ever time out or fail
+                hostnames[ip] = None
+        
+        hostnames.update(self._resolve_global_hostnames(global_ips))
+        return hostnames
+    
+    def _resolve_global_hostnames(self, ip_list: List[str]) -> Dict[str, Optional[str]]:
+        """Resolve PTR hostnames for IPs already known to be global"""
+        hostnames = self._load_cached_hostnames(ip_list)
+        missing = [ip for ip in dict.fromkeys(ip_list) if ip not in hostnames]
+        
+        if not missing:
+            return hostnames
+        
+        # asyncio.run cannot nest inside a running loop (Jupyter, async callers)
+        if aiodns is not None and not _event_loop_running():
+            resolved = asyncio.run(self._resolve_hostnames_async(missing))
+        else:
+            with ThreadPoolExecutor(max_workers=self.dns_concurrency) as executor:
+                resolved = dict(zip(missing, executor.map(self.reverse_dns, missing)))
+        
+        self._store_cached_hostnames(resolved)
+        hostnames.update(resolved)
+        return hostnames
+    
+    async def _resolve_hostnames_async(self, ip_list: List[str]) -> Dict[str, Optional[str]]:
+        """Resolve PTR hostnames on a single event loop with c-ares"""
+        resolver = aiodns.DNSResolver(timeout=self.dns_timeout, tries=1)
+        semaphore = asyncio.Semaphore(self.dns_concurrency)
+        
+        async def ptr(ip: str) -> Optional[str]:
+            async with semaphore:
+                try:
+                    answer = await asyncio.wait_for(resolver.gethostbyaddr(ip), self.dns_timeout)
+                    return answer.name
+                except (aiodns.error.DNSError, asyncio.TimeoutError, ValueError):
+                    return None
+        
+        try:
+            hostnames = await asyncio.gather(*(ptr(ip) for ip in ip_list))
+        finally:
+            # close() only exists from aiodns 4.0 on
+            if hasattr(resolver, 'close'):
+                await resolver.close()
+        
+        return dict(zip(ip_list, hostnames))
+    
+    def _load_cached_hostnames(self, ip_list: List[str]) -> Dict[str, str]:
+        """Return unexpired hostnames from the PTR cache"""
+        if self._ptr_cache is None:
+            return {}
+        
+        now = time.time()
+        unique_ips = list(dict.fromkeys(ip_list))
+        cached = {}
+        with self._ptr_cache_lock:
+            # One query per chunk, kept under SQLite's host parameter limit
+            for offset in range(0, len(unique_ips), self.PTR_CACHE_CHUNK):
+                chunk = unique_ips[offset:offset + self.PTR_CACHE_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                cached.update(self._ptr_cache.execute(
+                    f'SELECT ip, hostname FROM ptr WHERE ip IN ({placeholders}) AND expires > ?',
+                    (*chunk, now)
+                ))
+        
+        return cached
+    
+    def _store_cached_hostnames(self, hostnames: Dict[str, Optional[str]]):
+        """Save resolved hostnames to the PTR cache (failed lookups are retried next run)"""
+        if self._ptr_cache is None:
+            return
+        
+        expires = time.time() + self.ttl_seconds
+        with self._ptr_cache_lock:
+            self._ptr_cache.executemany(
+                'INSERT OR REPLACE INTO ptr (ip, hostname, expires) VALUES (?, ?, ?)',
+                [(ip, hostname, expires) for ip, hostname in hostnames.items() if hostname]
+            )
+    
+    def extract_location_from_hostname(self, hostname: str) -> Optional[str]:
+        """Extract location hints from hostname (cached, see module-level function)"""
+        return extract_location_from_hostname(hostname)
+    
+    def calculate_confidence(self, result: RouterResult) -> str:
         """
         Calculate confidence level based on available data
         
@@ -142,23 +350,23 @@ class RouterGeolocator:
         score = 0
         
         # Has coordinates
-        if result['latitude'] and result['longitude']:
+        if result.latitude and result.longitude:
             score += 2
         
         # Has city name
-        if result['city']:
+        if result.city:
             score += 2
         
         # Has DNS hostname
-        if result['hostname']:
+        if result.hostname:
             score += 1
         
         # Has DNS location hints
-        if result['dns_hints']:
+        if result.dns_hints:
             score += 2
         
         # Small accuracy radius (< 50km)
-        if result['accuracy_radius'] and result['accuracy_radius'] < 50:
+        if result.accuracy_radius and result.accuracy_radius < 50:
             score += 1
         
         if score >= 6:
@@ -170,70 +378,134 @@ class RouterGeolocator:
         else:
             return 'none'
     
-    def process_ip_list(self, ip_list: List[str], output_csv: str = 'router_locations.csv'):
+    def iter_results(self, entries: List[Tuple[str, Optional[str]]]) -> Iterator[RouterResult]:
+        """
+        Geolocate IPs one by one, in input order
+        
+        Reverse DNS is only done for entries without a hostname, all at once
+        up front. MaxMind lookups then run in windows of GEO_WINDOW entries,
+        each looked up in numeric IP order so neighbouring addresses reuse
+        the same mmdb tree pages, and yielded back in input order.
+        
+        Args:
+            entries: List of (ip, hostname or None) tuples, as from parse_router_file
+        
+        Yields:
+            RouterResult per IP
+        """
+        # Parse every IP once; the result drives the DNS filter, sort and lookup
+        checked = [_check_ip(ip) for ip, _ in entries]
+        hostnames = self._resolve_global_hostnames([
+            ip for (ip, hostname), (address, _) in zip(entries, checked)
+            if not hostname and address is not None
+        ])
+        
+        for offset in range(0, len(entries), self.GEO_WINDOW):
+            window = entries[offset:offset + self.GEO_WINDOW]
+            window_checked = checked[offset:offset + self.GEO_WINDOW]
+            
+            geo_results = [None] * len(window)
+            for i in sorted(range(len(window)), key=lambda i: _ip_sort_key(window_checked[i][0])):
+                geo_results[i] = self._lookup_geo(window[i][0], window_checked[i][1])
+            
+            for (ip, hostname), result in zip(window, geo_results):
+                yield self._annotate(result, hostname or hostnames.get(ip))
+    
+    def process_ip_list(self, entries: List[Tuple[str, Optional[str]]],
+                        output_csv: str = 'router_locations.csv'):
         """
-        Process list of IPs and save results to CSV
+        Process list of IPs and stream results to CSV
+        
+        Rows are written as soon as they are ready and only running totals
+        are kept for the summary, so memory stays flat for large lists.
         
         Args:
-            ip_list: List of IP addresses
+            entries: List of (ip, hostname or None) tuples; known hostnames skip DNS
             output_csv: Output filename
         """
-        results = []
+        stats = self._new_stats()
         
-        print(f"\nProcessing {len(ip_list)} IP addresses...")
+        print(f"\nProcessing {len(entries)} IP addresses...")
         print("-" * 60)
         
-        for i, ip in enumerate(ip_list, 1):
-            result = self.lookup_ip(ip)
-            results.append(result)
-            
-            # Print progress
-            status = "✓" if result.get('city') else "✗"
-            city = result.get('city') or 'Not found'
-            dns_hint = f" (DNS: {result['dns_hints']})" if result.get('dns_hints') else ""
+        with open(output_csv, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=self.CSV_FIELDS, extrasaction='ignore')
+            writer.writeheader()
             
-            print(f"{status} [{i}/{len(ip_list)}] {ip:15s} → {city}{dns_hint}")
+            for i, result in enumerate(self.iter_results(entries), 1):
+                writer.writerow(asdict(result))
+                if i % self.CSV_FLUSH_EVERY == 0:
+                    f.flush()
+                
+                self._tally(stats, result)
+                
+                # Print progress
+                status = "✓" if result.city else "✗"
+                city = result.city or 'Not found'
+                dns_hint = f" (DNS: {result.dns_hints})" if result.dns_hints else ""
+                
+                print(f"{status} [{i}/{len(entries)}] {result.ip:15s} → {city}{dns_hint}")
         
-        # Save to CSV
-        self.save_to_csv(results, output_csv)
         print(f"\n✓ Results saved to: {output_csv}")
         
         # Print summary
-        self.print_summary(results)
-        
-        return results
+        self._print_stats(stats)
     
-    def save_to_csv(self, results: List[Dict], filename: str):
+    def save_to_csv(self, results: List[RouterResult], filename: str):
         """Save results to CSV file"""
         if not results:
             return
         
-        fieldnames = ['ip', 'country', 'city', 'subdivision', 'latitude', 'longitude',
-                     'accuracy_radius', 'postal_code', 'hostname', 'dns_hints', 
-                     'confidence', 'error']
-        
         with open(filename, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            # Only write fields that exist in CSV_FIELDS
+            writer = csv.DictWriter(f, fieldnames=self.CSV_FIELDS, extrasaction='ignore')
             writer.writeheader()
-            
-            for result in results:
-                # Only write fields that exist in fieldnames
-                row = {k: v for k, v in result.items() if k in fieldnames}
-                writer.writerow(row)
+            writer.writerows(asdict(result) for result in results)
     
-    def print_summary(self, results: List[Dict]):
+    def print_summary(self, results: List[RouterResult]):
         """Print summary statistics"""
-        total = len(results)
-        found = sum(1 for r in results if r.get('city'))
-        with_dns = sum(1 for r in results if r.get('hostname'))
-        with_hints = sum(1 for r in results if r.get('dns_hints'))
-        
-        confidence_counts = {
-            'high': sum(1 for r in results if r.get('confidence') == 'high'),
-            'medium': sum(1 for r in results if r.get('confidence') == 'medium'),
-            'low': sum(1 for r in results if r.get('confidence') == 'low'),
-            'none': sum(1 for r in results if r.get('confidence') == 'none')
+        stats = self._new_stats()
+        for result in results:
+            self._tally(stats, result)
+        
+        self._print_stats(stats)
+    
+    @staticmethod
+    def _new_stats() -> Dict:
+        """Empty running totals for _tally"""
+        return {
+            'total': 0,
+            'found': 0,
+            'with_dns': 0,
+            'with_hints': 0,
+            'confidence': Counter(),
+            'cities': Counter(),
         }
+    
+    @staticmethod
+    def _tally(stats: Dict, result: RouterResult):
+        """Add one result to the running totals"""
+        stats['total'] += 1
+        stats['found'] += bool(result.city)
+        stats['with_dns'] += bool(result.hostname)
+        stats['with_hints'] += bool(result.dns_hints)
+        stats['confidence'][result.confidence or 'none'] += 1
+        
+        # City distribution for Taiwan
+        if result.country == 'Taiwan':
+            stats['cities'][result.city or 'Unknown'] += 1
+    
+    def _print_stats(self, stats: Dict):
+        """Print summary statistics from running totals"""
+        total = stats['total']
+        if not total:
+            return
+        
+        found = stats['found']
+        with_dns = stats['with_dns']
+        with_hints = stats['with_hints']
+        confidence_counts = stats['confidence']
+        cities = stats['cities']
         
         print("\n" + "=" * 60)
         print("SUMMARY")
@@ -249,33 +521,85 @@ class RouterGeolocator:
         print(f"  None:    {confidence_counts['none']} ({confidence_counts['none']/total*100:.1f}%)")
         
         # City distribution for Taiwan
-        taiwan_results = [r for r in results if r.get('country') == 'Taiwan']
-        if taiwan_results:
-            cities = {}
-            for r in taiwan_results:
-                city = r.get('city') or 'Unknown'
-                cities[city] = cities.get(city, 0) + 1
-            
+        if cities:
             print(f"\nTaiwan city distribution:")
             for city, count in sorted(cities.items(), key=lambda x: x[1], reverse=True):
                 print(f"  {city:20s}: {count}")
     
     def __del__(self):
-        """Close database reader"""
+        """Close database reader and PTR cache"""
         if hasattr(self, 'reader'):
             self.reader.close()
+        if getattr(self, '_ptr_cache', None) is not None:
+            with self._ptr_cache_lock:
+                self._ptr_cache.close()
 
 
-def parse_router_file(filename: str) -> List[Tuple[str, Optional[str]]]:
+@lru_cache(maxsize=100_000)
+def extract_location_from_hostname(hostname: str) -> Optional[str]:
     """
-    Parse router file in the format:
-       1. 140.123.103.250    csgate103.cs.ccu.edu.tw
-       
+    Extract location hints from hostname using Taiwan city codes
+    
+    Args:
+        hostname: Domain name or hostname
+        
     Returns:
-        List of tuples: [(ip, hostname), ...]
+        Detected city name or None
+    """
+    hostname_lower = hostname.lower()
+    
+    if _CODE_AUTOMATON is None:
+        # Look for a code as whole word, with delimiters, or followed by a digit
+        match = _CODE_RE.search(hostname_lower)
+        return TAIWAN_CODES[match.group(1)] if match else None
+    
+    # Same rules as the regex: leftmost code wins, then the longest one
+    best = None
+    for end, code in _CODE_AUTOMATON.iter(hostname_lower):
+        start = end - len(code) + 1
+        if start > 0 and hostname_lower[start - 1].isalnum():
+            continue
+        if end + 1 < len(hostname_lower) and hostname_lower[end + 1].isalpha():
+            continue
+        if best is None or (start, -len(code)) < (best[0], -len(best[1])):
+            best = (start, code)
+    
+    return TAIWAN_CODES[best[1]] if best else None
+
+
+def _event_loop_running() -> bool:
+    """True when called from inside a running asyncio event loop"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _check_ip(ip: str) -> Tuple[Optional[IPAddress], Optional[str]]:
     """
-    routers = []
-    ip_pattern = re.compile(r'^\s*\d+\.\s+(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\s+(.*)')
+    Parse an IP address once
+    
+    Returns:
+        (address, None) for publicly routable addresses, otherwise
+        (None, error) for private, reserved or invalid ones
+    """
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError as e:
+        return None, str(e)
+    
+    if not address.is_global:
+        return None, 'Non-global (private/reserved) address'
+    
+    return address, None
+
+
+def _ip_sort_key(address: Optional[IPAddress]) -> Tuple[int, int]:
+    """Numeric sort key for parsed IP addresses; None sorts first"""
+    if address is None:
+        return (0, 0)
+    return (address.version, int(address))
 
 
 def parse_router_file(filename: str) -> List[Tuple[str, Optional[str]]]:
@@ -286,18 +610,19 @@ def parse_router_file(filename: str) -> List[Tuple[str, Optional[str]]]:
     Returns:
         List of tuples: [(ip, hostname), ...]
     """
-    routers = []
-    ip_pattern = re.compile(r'^\s*\d+\.\s+(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\s+(.*)')
-
-    with open(filename, 'r', encoding='utf-8') as f:
-        for line in f:
-            match = ip_pattern.match(line)
-            if match:
-                ip = match.group(1)
-                hostname = match.group(2).strip() if match.group(2).strip() else None
-                routers.append((ip, hostname))
-    
-    return routers
+    with open(filename, 'rb') as f:
+        info = os.fstat(f.fileno())
+        
+        # One regex scan over the mapped file, without copying it into a str first.
+        # Pipes, FIFOs and empty files cannot be mapped, so read those instead.
+        if stat.S_ISREG(info.st_mode) and info.st_size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                matches = _IP_LINE_RE.findall(data)
+        else:
+            matches = _IP_LINE_RE.findall(f.read())
+        
+        return [(ip.decode('ascii'), hostname.strip().decode('utf-8') or None)
+                for ip, hostname in matches]
 
 
 def main():
@@ -321,11 +646,8 @@ def main():
         routers = parse_router_file(router_file)
         print(f"✓ Parsed {len(routers)} routers from file")
         
-        # Extract just the IPs
-        ip_list = [ip for ip, _ in routers]
-        
-        # Process IPs
-        results = geolocator.process_ip_list(ip_list, output_csv='router_locations.csv')
+        # Process IPs, reusing hostnames from the file instead of reverse DNS
+        geolocator.process_ip_list(routers, output_csv='router_locations.csv')
         
     else:
         print(f"\n⚠ {router_file} not found!")
@@ -333,12 +655,12 @@ def main():
         
         # Example Taiwan router IPs
         sample_ips = [
-            '1.34.0.1',        # Chunghwa Telecom
-            '168.95.1.1',      # HiNet DNS
-            '203.133.1.1',     # Taiwan Academic Network
+            ('1.34.0.1', None),        # Chunghwa Telecom
+            ('168.95.1.1', None),      # HiNet DNS
+            ('203.133.1.1', None),     # Taiwan Academic Network
         ]
         
-        results = geolocator.process_ip_list(sample_ips)
+        geolocator.process_ip_list(sample_ips)
     
     print("\n" + "=" * 60)
     print("NEXT STEPS")
@@ -27,22 +27,21 @@ counts = [
 ]
 
 # Sort by count descending
-sorted_indices = np.argsort(counts)[::-1]
-cities_sorted = [cities[i] for i in sorted_indices]
-counts_sorted = [counts[i] for i in sorted_indices]
+counts = np.asarray(counts)
+sorted_indices = counts.argsort()[::-1]
+cities_sorted = np.asarray(cities)[sorted_indices]
+counts_sorted = counts[sorted_indices]
 
 # Calculate percentages
-total = sum(counts_sorted)
-percentages = [c / total * 100 for c in counts_sorted]
+percentages = counts_sorted / counts_sorted.sum() * 100
 
 # Plot
 fig, ax = plt.subplots(figsize=(9, 8))
 bars = ax.barh(cities_sorted[::-1], counts_sorted[::-1], color='gray', edgecolor='black')
 
 # Add percentage labels
-for bar, pct in zip(bars, percentages[::-1]):
-    ax.text(bar.get_width() + 2, bar.get_y() + bar.get_height()/2,
-            f"{pct:.1f}%", va='center', fontsize=8, color='black')
+ax.bar_label(bars, labels=[f"{pct:.1f}%" for pct in percentages[::-1]],
+             padding=2, fontsize=8, color='black')
 
 # Axis labels and title
 ax.set_xlabel("Count")